@@ -83,6 +83,8 @@ with sqlite3.connect(DB_PATH) as conn:
     cur = conn.cursor()
     cur.execute('''DROP TABLE IF EXISTS library;''')
     cur.execute('''DROP TABLE IF EXISTS settings;''')
+    # rasterized images are cached by the app and depend on the library
+    cur.execute('''DROP TABLE IF EXISTS raster;''')
     cur.execute('''CREATE TABLE "settings" (
 	"choice"	INTEGER,
 	"screen0x"	INTEGER,
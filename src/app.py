@@ -7,9 +7,10 @@ Created on Tue Oct 27 08:17:58 2020
 
 
 import math
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pyperclip
-import pystray
-from pystray import MenuItem as item
 import psutil
 import textwrap
 from PIL import Image, ImageTk, ImageDraw, ImageFilter, ImageGrab
@@ -20,6 +21,8 @@ import sqlite3
 import re
 import base64
 import time
+import threading
+import queue
 import tkinter as tk
 import os
 from pathlib import Path
@@ -34,11 +37,202 @@ Image.ANTIALIAS = Image.LANCZOS
 
 DISPLAY_COUNT = 0
 
+# window size and pivot point of the clock hands
+WIDTH, HEIGHT = 400, 420
+CLOCK_CENTER = (WIDTH / 2, 60 + 175)
+# (cos, sin) of a clock hand per tenth of a degree, 0 points to 12 o'clock
+UNIT_VECTORS = tuple(
+    (math.cos(math.radians(a / 10 - 90)), math.sin(math.radians(a / 10 - 90)))
+    for a in range(3600)
+)
+# inner and outer end of the twelve hour markers on the dial
+HOUR_MARKERS = tuple(
+    (
+        CLOCK_CENTER[0] + 160 * math.cos(math.radians(i*30) - math.radians(90)),
+        CLOCK_CENTER[1] + 160 * math.sin(math.radians(i*30) - math.radians(90)),
+        CLOCK_CENTER[0] + 175 * math.cos(math.radians(i*30) - math.radians(90)),
+        CLOCK_CENTER[1] + 175 * math.sin(math.radians(i*30) - math.radians(90))
+    )
+    for i in range(1, 13)
+)
+# number of rendered kanji kept around for quick navigation
+FRAME_CACHE_SIZE = 32
+# number of rendered stroke order PNGs kept in memory
+PNG_CACHE_SIZE = 512
+# left edges of the 50px wide quit, prev and next buttons
+QUIT_X = (WIDTH - 50) / 2
+PREV_X = QUIT_X - 150
+NEXT_X = QUIT_X + 150
+# bounding boxes of the round buttons
+QUIT_BOX = (QUIT_X, 5, QUIT_X + 50, 55)
+PREV_BOX = (PREV_X, 350, PREV_X + 50, 400)
+NEXT_BOX = (NEXT_X, 350, NEXT_X + 50, 400)
+# box, gradient thickness, hover and idle fill of the quit, prev and next button
+BUTTONS = (
+    (QUIT_BOX, 5, 'orange', 'red'),
+    (PREV_BOX, 6, 'yellow', 'green'),
+    (NEXT_BOX, 6, 'yellow', 'green'),
+)
+
+
+# blended shadow colors of the antialiased lines
+AA_COLORS = {}
+
+# bandwidth units, KB = 1024, MB = 1,048,576, GB = 1,073,741,824
+KB = 1024.0
+MB = KB * KB
+GB = MB * KB
+BANDWIDTH_UNITS = (
+    (1.0, '{:.0f} bps'),
+    (KB, '{:.2f} Kbps'),
+    (MB, '{:.2f} Mbps'),
+    (GB, '{:.2f} Gbps')
+)
+
+# hex() of every byte value, as used by the search key of a character
+HEX_BYTES = tuple(hex(b) for b in range(256))
+
+# runs of kanji (CJK unified ideographs) in the clipboard text
+KANJI_RE = re.compile(u'[\u4E00-\u9FFF]+', re.U)
+
+# text columns shown for every kanji
+TEXT_FIELDS = (
+    'reading_type_ja_on',
+    'reading_type_ja_kun',
+    'nanori',
+    'jlpt',
+    'grade',
+    'stroke_count',
+    'radicals',
+    'meaning_type_en'
+)
+
 
 def get_current_screen_geometry():
     pass
 
 
+def svg_to_png(svg):
+    # stroke order images are stored as base64 encoded SVG files
+    return cairosvg.svg2png(
+        base64.b64decode(svg.encode()).decode(),
+        dpi=120,
+        output_width=140,
+        output_height=140
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def ellipse_mask(size):
+    # alpha channel of the round images, the same for every color and thickness
+    mask = Image.new('L', size, 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, *size), fill=255)
+    return mask
+
+
+@functools.lru_cache(maxsize=None)
+def shading_mask(size, border_width, thick):
+    # blurred disc of the round images, the blur is linear, so blurring it
+    # once and mixing in the color gives the same result for every color
+    mask = Image.new('L', (size[0]-border_width, size[1]-border_width), 0)
+    ImageDraw.Draw(mask).ellipse(
+        (thick, thick, size[0]-thick, size[1]-thick),
+        fill=255
+    )
+    return mask.filter(ImageFilter.GaussianBlur(thick//2))
+
+
+def hit(box, x, y):
+    # reject by the bounding box first, most events are nowhere near
+    x1, y1, x2, y2 = box
+    if not (x1 <= x <= x2 and y1 <= y <= y2):
+        return False
+    # compare squared distances, no square root needed
+    r = (x2 - x1) / 2
+    dx, dy = x - x1 - r, y - y1 - r
+    return dx*dx + dy*dy <= r*r
+
+
+@functools.lru_cache(maxsize=4096)
+def decode_field(value):
+    # non ascii values are stored base64 encoded by build_db.py,
+    # grades, JLPT levels and stroke counts repeat across most rows
+    if value:
+        try:
+            return base64.b64decode(value.encode()).decode()
+        except:
+            return value
+    return ''
+
+
+def wrap_text(text, text_width, step, limit=-1):
+    # every further line may be step characters narrower than the one before
+    lines = []
+    while text_width > 0:
+        wrapped = textwrap.wrap(
+            text,
+            text_width,
+            break_long_words=False
+        )
+        if not wrapped:
+            break
+        lines.append(wrapped[0])
+        if len(wrapped) == 1:
+            break
+        text = ' '.join(wrapped[1:])
+        text_width -= step
+    lines.sort(reverse=True, key=len)
+    if limit == -1:
+        limit = len(lines)
+    return tuple(lines[:limit])
+
+
+def wrap_fields(row):
+    # text blocks of a library row, ready to be drawn
+    fields = {key: decode_field(row[key]) for key in TEXT_FIELDS}
+    return {
+        'on': tuple(
+            line.replace(' ', '') for line in wrap_text(
+                fields['reading_type_ja_on'].replace('\n', '、 '),
+                18,
+                2,
+                limit=1
+            )
+        ),
+        'kun': tuple(
+            line.replace(' ', '') for line in wrap_text(
+                fields['reading_type_ja_kun'].replace('\n', '、 '),
+                19,
+                2,
+                limit=2
+            )
+        ),
+        'nanori': tuple(
+            line.replace(' ', '') for line in wrap_text(
+                fields['nanori'].replace('\n', '、 '),
+                17,
+                2,
+                limit=2
+            )
+        ),
+        'jlpt': fields['jlpt'],
+        'grade': fields['grade'],
+        'stroke_count': fields['stroke_count'],
+        'radicals': wrap_text(
+            fields['radicals'].replace('\n', '、'),
+            50,
+            2,
+            limit=1
+        ),
+        'meanings': wrap_text(
+            fields['meaning_type_en'].replace('\n', ', '),
+            40,
+            3,
+            limit=4
+        )
+    }
+
+
 if platform in ("linux", "linux2"):
     from Xlib import display
     from Xlib.ext import randr
@@ -99,20 +293,18 @@ class AntialiasedCanvas(tk.Canvas):
                 map(lambda x: x+winc, nargs['arrowshape']))
         # calculate width
         nargs['width'] += winc
-        # calculate color
-        cbg = self.winfo_rgb(self.cget("bg"))
-        cfg = list(self.winfo_rgb(nargs['fill']))
-        cfg[0] = (cfg[0] + cbg[0]*cw)/(cw+1)
-        cfg[1] = (cfg[1] + cbg[1]*cw)/(cw+1)
-        cfg[2] = (cfg[2] + cbg[2]*cw)/(cw+1)
-        nargs['fill'] = '#{0:02x}{1:02x}{2:02x}'.format(
-            *tuple(
-                map(
-                    int,
-                    (cfg[0]/256, cfg[1]/256, cfg[2]/256)
-                )
+        # calculate color, once per background, color and weight
+        key = (self.cget("bg"), nargs['fill'], cw)
+        if key not in AA_COLORS:
+            cbg = self.winfo_rgb(key[0])
+            cfg = list(self.winfo_rgb(nargs['fill']))
+            cfg[0] = (cfg[0] + cbg[0]*cw)/(cw+1)
+            cfg[1] = (cfg[1] + cbg[1]*cw)/(cw+1)
+            cfg[2] = (cfg[2] + cbg[2]*cw)/(cw+1)
+            AA_COLORS[key] = "#%02x%02x%02x" % (
+                int(cfg[0]) >> 8, int(cfg[1]) >> 8, int(cfg[2]) >> 8
             )
-        )
+        nargs['fill'] = AA_COLORS[key]
 
         return nargs
 
@@ -128,6 +320,31 @@ class AntialiasedCanvas(tk.Canvas):
 
 
 class App():
+    # every instance attribute is listed here, new ones have to be added
+    __slots__ = (
+        'database', 'conn', 'data', 'choice', 'screen0', 'screen1',
+        'search_phrase', 'last_clip', 'clipboard_ts', 'image_selector',
+        'visible', 'last_motion', 'last_geometry', 'pending_geometry',
+        'last_tick',
+        'frame_cache', 'png_cache',
+        'char_index', 'image_menu_choice', 'image_keys', 'tk_image',
+        '_fade_after', '_update_after', '_bw_after', '_geometry_after',
+        '_raster_after', 'raster_pool', 'raster_jobs', '_clock_after',
+        'pending_clock',
+        'root', 'menu', 'image_selection_menu', 'clipboard_menu',
+        'select_image_cmd', 'search_cmd', 'compound', 'icon', 'onTop',
+        'opacity', 'canvas', 'bg', 'tk_bg', 'timer', 'hands',
+        'length', 'arrowshape', 'last_coords',
+        'last_extent', 'bandwidth',
+        'bandwidth_text', 'bandwidth_queue', 'stopped', 'old_value',
+        'new_value', 'old_time', 'button_fills', 'button_images',
+        'button_quit', 'button_quit_bg', 'tk_button_quit_bg',
+        'button_quit_bg_img', 'button_quit_text',
+        'button_prev', 'button_prev_bg', 'tk_button_prev_bg',
+        'button_prev_bg_img', 'prev_button_text',
+        'button_next', 'button_next_bg', 'tk_button_next_bg',
+        'button_next_bg_img', 'next_button_text',
+    )
     x, y = 0, 0
 
     def __init__(self):
@@ -135,8 +352,43 @@ class App():
             (os.path.dirname(os.path.abspath(__file__)), "kanjidic.db")
         )
         self.search_phrase = ''
+        self.last_clip = None
+        self.clipboard_ts = 0.0
         self.image_selector = 0
-        with sqlite3.connect(self.database) as conn:
+        self.visible = True
+        self.last_motion = None
+        self.last_geometry = None
+        self.pending_geometry = None
+        self.last_tick = None
+        self.frame_cache = OrderedDict()
+        self.png_cache = OrderedDict()
+        self.char_index = None
+        self.image_menu_choice = None
+        # pending after() ids of the fade, clock, bandwidth, drag and
+        # raster callbacks
+        self._fade_after = None
+        self._update_after = None
+        self._bw_after = None
+        self._geometry_after = None
+        self._raster_after = None
+        self._clock_after = None
+        self.pending_clock = None
+        # SVG files are rendered off the Tk thread, see rasterize()
+        self.raster_pool = ThreadPoolExecutor(max_workers=2)
+        self.raster_jobs = {}
+        # one connection for the whole session, in autocommit mode so that
+        # settings writes do not need an explicit commit (and fsync) each
+        self.conn = sqlite3.connect(self.database, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL;')
+        self.conn.execute('PRAGMA synchronous=NORMAL;')
+        # rasterized stroke order images, filled on first display
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS raster (
+            cp_type_ucs text NOT NULL,
+            img text NOT NULL,
+            png blob NOT NULL,
+            PRIMARY KEY (cp_type_ucs, img)
+        );''')
+        with self.conn as conn:
             def dict_factory(cursor, row):
                 d = {}
                 for idx, col in enumerate(cursor.description):
@@ -187,10 +439,31 @@ class App():
         self.root.lift()
 
         self.root.protocol('WM_DELETE_WINDOW', self.withdraw)
+        # Tcl commands shared by all menu entries, registered only once
+        self.select_image_cmd = self.root.register(self.select_image)
+        self.search_cmd = self.root.register(self.search)
+        # the context menu is built once, its entries are updated in place
+        self.menu = tk.Menu(self.root, tearoff=0)
+        self.menu.add_command(label="Quit", command=self.quit)
+        self.menu.add_command(label="ToogleOnTop", command=self.switch)
+        self.image_selection_menu = tk.Menu(self.menu, tearoff=0)
+        self.menu.add_cascade(
+            label="Images",
+            menu=self.image_selection_menu,
+            state='disabled'
+        )
+        self.clipboard_menu = tk.Menu(self.menu, tearoff=0)
+        self.menu.add_cascade(
+            label="Search",
+            menu=self.clipboard_menu,
+            state='disabled'
+        )
+        self.menu.add_separator()
+        self.menu.add_command(label="Cancel", command=self.menu.unpost)
         if DISPLAY_COUNT > 2:
-            self.root.geometry("400x420+{}+{}".format(*self.screen1))
+            self.root.geometry("{}x{}+{}+{}".format(WIDTH, HEIGHT, *self.screen1))
         else:
-            self.root.geometry("400x420+{}+{}".format(*self.screen0))
+            self.root.geometry("{}x{}+{}+{}".format(WIDTH, HEIGHT, *self.screen0))
         self.root.bind("<FocusOut>", self.reset)
 
         self.__paint()
@@ -199,16 +472,18 @@ class App():
         self.root.bind("<B1-Motion>", self.mouse_motion)
         self.root.bind("<Button-1>", self.mouse_press)
         self.root.bind("<ButtonRelease-1>", self.mouse_release)
-        self.compound = lambda ev, s=self: [s.reset(), setattr(s, 'after_id_2', s.root.after(500, s.fadeOut))]
+        self.compound = lambda ev, s=self: [s.reset(), setattr(s, '_fade_after', s.__schedule(s._fade_after, 500, s.fadeOut))]
         self.root.bind("<Leave>", self.compound)
         self.root.bind("<FocusOut>", self.compound)
         self.root.bind("<Enter>", self.awake)
         self.root.bind("<FocusIn>", self.awake)
 
-        if not hasattr(self, 'after_id_2'):
-            self.after_id_2 = self.root.after(500, self.fadeOut)
+        if self._fade_after is None:
+            self._fade_after = self.root.after(500, self.fadeOut)
 
     def do_popup(self, event):
+        if hasattr(self, '_App__refresh_image_menu'):
+            self.__refresh_image_menu()
         if hasattr(self, '_App__refresh_search_menu'):
             self.__refresh_search_menu()
         if self.menu.winfo_exists():
@@ -230,19 +505,25 @@ class App():
 
     def mouse_motion(self, event):
         if self.root.winfo_exists():
-            if hasattr(self, "after_id"):
-                self.root.after_cancel(self.after_id)
-                delattr(self, 'after_id')
+            self._update_after = self.__cancel(self._update_after)
             offset_x, offset_y = event.x - App.x, event.y - App.y
             new_x = self.root.winfo_x() + offset_x
             new_y = self.root.winfo_y() + offset_y
-            self.root.geometry(f"+{new_x}+{new_y}")
+            # a burst of motion events is applied once, at the next idle
+            self.pending_geometry = (new_x, new_y)
+            if self._geometry_after is None:
+                self._geometry_after = self.root.after_idle(self.__apply_geometry)
+
+    def __apply_geometry(self):
+        self._geometry_after = None
+        # a drag reports many events per pixel, move only on a change
+        if self.pending_geometry != self.last_geometry:
+            self.last_geometry = self.pending_geometry
+            self.root.wm_geometry('+%d+%d' % self.last_geometry)
 
     def mouse_press(self, event):
         if self.root.winfo_exists():
-            if hasattr(self, "after_id"):
-                self.root.after_cancel(self.after_id)
-                delattr(self, 'after_id')
+            self._update_after = self.__cancel(self._update_after)
             count = time.time()
             App.x, App.y = event.x, event.y
 
@@ -256,255 +537,55 @@ class App():
                 self.screen0 = (new_x, new_y)
             else:
                 self.screen1 = (new_x, new_y)
-            with sqlite3.connect(self.database) as conn:
-                cur = conn.cursor()
-                cur.execute('''REPLACE INTO settings(idx, choice, screen0x, screen0y, screen1x, screen1y) 
-                VALUES(1, {}, {});'''.format(
-                    self.choice,
-                    ', '.join(map(str, self.screen0 + self.screen1))
-                ))
-                conn.commit()
+            self.save_settings()
             if hasattr(self, '_App__paint'):
-                self.after_id = self.root.after(100, self.__update)
+                self._update_after = self.__schedule(self._update_after, 100, self.__update)
+
+    def save_settings(self):
+        self.conn.execute(
+            '''REPLACE INTO settings(idx, choice, screen0x, screen0y, screen1x, screen1y)
+            VALUES(1, ?, ?, ?, ?, ?);''',
+            (self.choice, *self.screen0, *self.screen1)
+        )
 
     def send_stat(self):
+        counters = psutil.net_io_counters()
+        self.new_value = counters.bytes_sent + counters.bytes_recv
+        new_time = time.monotonic()
         if not hasattr(self, 'old_value'):
-            self.old_value = 0
-        self.new_value = psutil.net_io_counters().bytes_sent + \
-            psutil.net_io_counters().bytes_recv
-        old_value = self.old_value
-        self.old_value = self.new_value
-        B = float(self.new_value - old_value)*8
-        KB = float(1024)
-        MB = float(KB ** 2)  # 1,048,576
-        GB = float(KB ** 3)  # 1,073,741,824
-        if B < KB:
-            return '{:.0f} bps'.format(B)
-        elif KB <= B < MB:
-            return '{:.2f} Kbps'.format(B/KB)
-        elif MB <= B < GB:
-            return '{:.2f} Mbps'.format(B/MB)
-        else:
-            return '{:.2f} Gbps'.format(B/GB)
+            self.old_value, self.old_time = self.new_value, new_time
+        old_value, old_time = self.old_value, self.old_time
+        self.old_value, self.old_time = self.new_value, new_time
+        # scale by the real sampling period, after() callbacks drift
+        B = float(self.new_value - old_value)*8 / ((new_time - old_time) or 1)
+        # every unit is 10 bits wide, anything above GB stays in Gbps
+        unit = min((int(B).bit_length() - 1) // 10, 3) if B >= 1 else 0
+        scale, fmt = BANDWIDTH_UNITS[unit]
+        return fmt.format(B/scale)
 
     def __paint(self):
         if self.root.winfo_exists():
-            if hasattr(self, "after_id"):
-                self.root.after_cancel(self.after_id)
-                delattr(self, 'after_id')
-            for slave in self.root.grid_slaves() + self.root.pack_slaves():
-                slave.destroy()
-            for attr in ["menu"]:
-                try:
-                    getattr(self, attr).destroy()
-                except:
-                    pass
-
             def onclick(event):
-                if math.sqrt((event.x - self.root.winfo_width()/2)**2 +
-                             (event.y - 30)**2) <= 25:
+                if hit(QUIT_BOX, event.x, event.y):
                     self.withdraw()
-                elif math.sqrt((event.x - ((self.root.winfo_width()-50)/2 - 150 + 25))**2 +
-                               (event.y - 375)**2) <= 25:
+                elif hit(PREV_BOX, event.x, event.y):
                     self.prev()
-                elif math.sqrt((event.x - ((self.root.winfo_width()-50)/2 + 150 + 25))**2 +
-                               (event.y - 375)**2) <= 25:
+                elif hit(NEXT_BOX, event.x, event.y):
                     self.next()
 
             def moved(event):
+                if (event.x, event.y) == self.last_motion:
+                    return
+                self.last_motion = (event.x, event.y)
                 if self.canvas.winfo_exists():
-                    if math.sqrt((event.x - self.root.winfo_width()/2)**2 +
-                                 (event.y - 30)**2) <= 25:
-                        self.button_quit_bg = App.draw_ellipse_with_gradient(
-                            border_width=2,
-                            size=(
-                                50, 50),
-                            thick=5,
-                            fill='orange'
-                        )
-                        self.tk_button_quit_bg = ImageTk.PhotoImage(
-                            self.button_quit_bg
-                        )
-                        self.button_quit_bg_img = self.canvas.create_image(
-                            (self.root.winfo_width()-50)/2+1,
-                            6,
-                            image=self.tk_button_quit_bg,
-                            anchor='nw'
-                        )
-                        self.button_quit_text = self.canvas.create_text(
-                            self.root.winfo_width()/2,
-                            30,
-                            fill="white",
-                            font="Verdana 20",
-                            text="—"
-                        )
-                    else:
-                        self.button_quit_bg = App.draw_ellipse_with_gradient(
-                            border_width=2,
-                            size=(
-                                50, 50),
-                            thick=5,
-                            fill='red'
-                        )
-                        self.tk_button_quit_bg = ImageTk.PhotoImage(
-                            self.button_quit_bg
-                        )
-                        self.button_quit_bg_img = self.canvas.create_image(
-                            (self.root.winfo_width()-50)/2+1,
-                            6,
-                            image=self.tk_button_quit_bg,
-                            anchor='nw'
-                        )
-                        self.button_quit_text = self.canvas.create_text(
-                            self.root.winfo_width()/2,
-                            30,
-                            fill="white",
-                            font="Verdana 20",
-                            text="—"
-                        )
-                    if math.sqrt(
-                        (event.x - ((self.root.winfo_width()-50)/2 - 150 + 25))**2 +
-                            (event.y - 375)**2
-                    ) <= 25:
-                        self.button_prev_bg = App.draw_ellipse_with_gradient(
-                            border_width=2,
-                            size=(
-                                50, 50),
-                            thick=6,
-                            fill='yellow'
-                        )
-                        self.tk_button_prev_bg = ImageTk.PhotoImage(
-                            self.button_prev_bg
-                        )
-                        self.button_prev_bg_img = self.canvas.create_image(
-                            (self.root.winfo_width()-50)/2 - 150 + 1,
-                            351,
-                            image=self.tk_button_prev_bg,
-                            anchor='nw'
-                        )
-                        self.prev_button_text = self.canvas.create_text(
-                            (self.root.winfo_width()-50)/2 - 150 + 25,
-                            375,
-                            fill="white",
-                            font="Verdana 20",
-                            text="<<"
-                        )
-                    else:
-                        self.button_prev_bg = App.draw_ellipse_with_gradient(
-                            border_width=2,
-                            size=(
-                                50, 50),
-                            thick=6,
-                            fill='green'
-                        )
-                        self.tk_button_prev_bg = ImageTk.PhotoImage(
-                            self.button_prev_bg
-                        )
-                        self.button_prev_bg_img = self.canvas.create_image(
-                            (self.root.winfo_width()-50)/2 - 150 + 1,
-                            351,
-                            image=self.tk_button_prev_bg,
-                            anchor='nw'
-                        )
-                        self.prev_button_text = self.canvas.create_text(
-                            (self.root.winfo_width()-50)/2 - 150 + 25,
-                            375,
-                            fill="white",
-                            font="Verdana 20",
-                            text="<<"
-                        )
-                    if math.sqrt(
-                        (event.x - ((self.root.winfo_width()-50)/2 + 150 + 25))**2 +
-                        (event.y - 375)**2
-                    ) <= 25:
-                        self.button_next_bg = App.draw_ellipse_with_gradient(
-                            border_width=2,
-                            size=(
-                                50, 50),
-                            thick=6,
-                            fill='yellow'
-                        )
-                        self.tk_button_next_bg = ImageTk.PhotoImage(
-                            self.button_next_bg
-                        )
-                        self.button_next_bg_img = self.canvas.create_image(
-                            (self.root.winfo_width()-50)/2 + 150 + 1,
-                            351,
-                            image=self.tk_button_next_bg,
-                            anchor='nw'
-                        )
-                        self.next_button_text = self.canvas.create_text(
-                            (self.root.winfo_width()-50)/2 + 150 + 25,
-                            375,
-                            fill="white",
-                            font="Verdana 20",
-                            text=">>"
-                        )
-                    else:
-                        self.button_next_bg = App.draw_ellipse_with_gradient(
-                            border_width=2,
-                            size=(
-                                50, 50),
-                            thick=6,
-                            fill='green'
-                        )
-                        self.tk_button_next_bg = ImageTk.PhotoImage(
-                            self.button_next_bg
-                        )
-                        self.button_next_bg_img = self.canvas.create_image(
-                            (self.root.winfo_width()-50)/2 + 150 + 1,
-                            351,
-                            image=self.tk_button_next_bg,
-                            anchor='nw'
-                        )
-                        self.next_button_text = self.canvas.create_text(
-                            (self.root.winfo_width()-50)/2 + 150 + 25,
-                            375,
-                            fill="white",
-                            font="Verdana 20",
-                            text=">>"
-                        )
-
-            def get(key):
-                ret = self.data[self.choice][key]
-                if ret:
-                    try:
-                        return base64.b64decode(ret.encode()).decode()
-                    except:
-                        return ret
-                return ''
-
-            def wrap(text, text_width, step, limit=-1):
-                def inner(text, text_width, step):
-                    if text_width <= 0:
-                        return tuple()
-                    lines = textwrap.wrap(
-                        text,
-                        text_width,
-                        break_long_words=False
-                    )
-                    if len(lines) > 1:
-                        return lines[0], *wrap('\n'.join(lines[1:]), text_width - step, step)
-                    elif len(lines) > 0:
-                        return (lines[0], )
-                    else:
-                        return tuple()
-                result = tuple(
-                    sorted(
-                        inner(text, text_width, step),
-                        reverse=True,
-                        key=len
-                    )
-                )
-                if limit == -1:
-                    limit = len(result)
-                return result[:limit]
+                    x, y, draw_button = event.x, event.y, self.__draw_button
+                    for n, (box, *_, hover, idle) in enumerate(BUTTONS):
+                        draw_button(n, hover if hit(box, x, y) else idle)
 
-            self.root.update()
             self.canvas = AntialiasedCanvas(
                 self.root,
-                width=self.root.winfo_width(),
-                height=self.root.winfo_height(),
+                width=WIDTH,
+                height=HEIGHT,
                 bg='#abcdef',
                 highlightthickness=0
             )
@@ -513,9 +594,9 @@ class App():
              
             '''
             self.button_quit = self.canvas.create_oval(
-                (self.root.winfo_width()-50)/2,
+                QUIT_X,
                 5,
-                50+(self.root.winfo_width()-50)/2,
+                50+QUIT_X,
                 55,
                 fill='',
                 width=2
@@ -528,13 +609,13 @@ class App():
             )
             self.tk_button_quit_bg = ImageTk.PhotoImage(self.button_quit_bg)
             self.button_quit_bg_img = self.canvas.create_image(
-                (self.root.winfo_width()-50)/2+1,
+                QUIT_X+1,
                 6,
                 image=self.tk_button_quit_bg,
                 anchor='nw'
             )
             self.button_quit_text = self.canvas.create_text(
-                self.root.winfo_width()/2,
+                WIDTH/2,
                 30,
                 fill="white",
                 font="Verdana 20",
@@ -546,9 +627,9 @@ class App():
             
             '''
             self.canvas.create_oval(
-                (self.root.winfo_width()-350)/2,
+                (WIDTH-350)/2,
                 60,
-                350+(self.root.winfo_width()-350)/2,
+                350+(WIDTH-350)/2,
                 410,
                 fill='',
                 width=2,
@@ -562,15 +643,15 @@ class App():
             )
             self.tk_bg = ImageTk.PhotoImage(self.bg)
             self.canvas.create_image(
-                (self.root.winfo_width()-350)/2+1,
+                (WIDTH-350)/2+1,
                 61,
                 image=self.tk_bg,
                 anchor='nw'
             )
             self.timer = self.canvas.create_arc(
-                self.root.winfo_width()/2 - 50,
+                WIDTH/2 - 50,
                 60 + 175 - 50,
-                self.root.winfo_width()/2 + 50,
+                WIDTH/2 + 50,
                 60 + 175 + 50,
                 start=90,
                 extent=-
@@ -579,16 +660,9 @@ class App():
                 fill='light gray',
                 outline='light gray'
             )
-            for i in range(1, 13):
+            for marker in HOUR_MARKERS:
                 self.canvas.create_line(
-                    self.root.winfo_width()/2 + 160 * math.cos(math.radians(i*30) - math.radians(90)),
-                    60 + 175 + 160 *
-                    math.sin(math.radians(
-                        i*30) - math.radians(90)),
-                    self.root.winfo_width()/2 + 175 * math.cos(math.radians(i*30) - math.radians(90)),
-                    60 + 175 + 175 *
-                    math.sin(math.radians(
-                        i*30) - math.radians(90)),
+                    *marker,
                     width=2.0,
                     fill='snow',
                     smooth=True,
@@ -597,15 +671,19 @@ class App():
                     splinesteps=12
                 )
 
-            self.sticks = []
-            self.antialiasing = []
+            # (stick, antialiasing shadow, length) of the hour, minute and
+            # second hand
+            hands = []
+            # what was last sent to Tk, unchanged items are not touched
+            self.last_coords = [None] * 3
+            self.last_extent = None
             self.length = (120, 160, 150)
             self.arrowshape = ((12, 16, 6), (15, 18, 8), (10, 13, 5))
             for i in range(3):
                 store, shadow = self.canvas.create_line(
-                    self.root.winfo_width()/2,
+                    WIDTH/2,
                     60 + 175,
-                    self.root.winfo_width()/2 +
+                    WIDTH/2 +
                     self.length[i],
                     60 + 175 +
                     self.length[i],
@@ -620,169 +698,39 @@ class App():
                     winc=1.5,
                     cw=2
                 )
-                self.sticks.append(store)
-                self.antialiasing.append(shadow)
+                hands.append((store, shadow, self.length[i]))
+            self.hands = tuple(hands)
 
             t = time.time()
             now_loc = time.localtime(t)
-            mlsec = float("%.9f" % (t % 1,))
-            t = time.strptime(str(now_loc.tm_hour), "%H")
-            hour = int(time.strftime("%I", t))*30
+            mlsec = t - int(t)
+            # 12-hour dial, midnight and noon point up like 12 o'clock
+            hour = (now_loc.tm_hour % 12 or 12)*30
             now = (hour + 30*now_loc.tm_min/60, now_loc.tm_min*6 +
                    6*now_loc.tm_sec/60, now_loc.tm_sec*6 + 6*mlsec)
-            for n, i in enumerate(now):
-                x, y = self.canvas.coords(self.sticks[n])[0:2]
-                cr = [x, y]
-                cr.append(
-                    self.length[n] * math.cos(math.radians(i) -
-                                              math.radians(90)) + self.root.winfo_width()/2
-                )
-                cr.append(
-                    self.length[n] *
-                    math.sin(math.radians(i) - math.radians(90)) + 60 + 175
-                )
-                self.canvas.coords(self.sticks[n], tuple(cr))
-                self.canvas.coords(self.antialiasing[n], tuple(cr))
-
-            self.image_keys = [
-                'img_{}'.format(i)
-                for i in range(9, -1, -1)
-                if self.data[self.choice]['img_{}'.format(i)]
-            ]
-            self.image_data = cairosvg.svg2png(
-                base64.b64decode(
-                    self.data[self.choice][self.image_keys[self.image_selector]].encode()
-                ).decode(),
-                dpi=120,
-                output_width=140,
-                output_height=140
-            )
-            self.image = Image.open(io.BytesIO(self.image_data))
-            self.tk_image = ImageTk.PhotoImage(self.image)
-            self.canvas.create_image(
-                (self.root.winfo_width()-150)/2,
-                70,
-                anchor=tk.NW,
-                image=self.tk_image
-            )
-            for idx, line in enumerate(
-                wrap(
-                    get('reading_type_ja_on').replace('\n', '、 '),
-                    18,
-                    2,
-                    limit=1
-                )
-            ):
-                self.canvas.create_text(
-                    self.root.winfo_width()/2,
-                    210,
-                    fill="maroon",
-                    font="Verdana 14 bold",
-                    text=line.replace(' ', '')
-                )
-            for idx, line in enumerate(
-                wrap(
-                    get('reading_type_ja_kun').replace('\n', '、 '),
-                    19,
-                    2,
-                    limit=2
-                )
-            ):
-                self.canvas.create_text(
-                    self.root.winfo_width()/2,
-                    230 + idx * 20,
-                    fill="darkblue",
-                    font="Verdana 14 bold",
-                    text=line.replace(' ', '')
-                )
+            self.__move_sticks(now)
 
-            if get('nanori'):
-                for idx, line in enumerate(
-                    wrap(
-                        get('nanori').replace('\n', '、 '),
-                        17,
-                        2,
-                        limit=2
-                    )
-                ):
-                    self.canvas.create_text(
-                        self.root.winfo_width()/2,
-                        270 + idx * 20,
-                        fill="darkgreen",
-                        font="Verdana 14 bold",
-                        text=line.replace(' ', '')
-                    )
-            if get('jlpt'):
-                self.canvas.create_text(
-                    self.root.winfo_width()/2 - 110,
-                    170,
-                    fill="darkgreen",
-                    font="Verdana 10",
-                    text='JLPT: ' + get('jlpt')
-                )
-            if get('grade'):
-                self.canvas.create_text(
-                    self.root.winfo_width()/2 - 120,
-                    190,
-                    fill="darkgreen",
-                    font="Verdana 10",
-                    text='grade: ' + get('grade')
-                )
-            self.canvas.create_text(
-                self.root.winfo_width()/2 + 120,
-                190,
-                fill="red",
-                font="Verdana 10",
-                text=get('stroke_count') + ' strokes'
-            )
+            self.bandwidth_text = self.send_stat()
+            # network counters are sampled off the Tk thread
+            self.bandwidth_queue = queue.Queue()
+            self.stopped = threading.Event()
+            threading.Thread(target=self.sample_bandwidth, daemon=True).start()
             self.bandwidth = self.canvas.create_text(
-                self.root.winfo_width()/2 + 105,
+                WIDTH/2 + 105,
                 170,
                 fill="darkgreen",
                 font="Verdana 10",
-                text=self.send_stat()
+                text=self.bandwidth_text
             )
-            for idx, line in enumerate(
-                wrap(
-                    get('radicals').replace('\n', '、'),
-                    50,
-                    2,
-                    limit=1
-                )
-            ):
-                self.canvas.create_text(
-                    self.root.winfo_width()/2,
-                    320 + idx * 15,
-                    fill="darkblue",
-                    font="Verdana 10 bold",
-                    text=line
-                )
-
-            for idx, line in enumerate(
-                wrap(
-                    get('meaning_type_en').replace('\n', ', '),
-                    40,
-                    3,
-                    limit=4
-                )
-            ):
-                self.canvas.create_text(
-                    self.root.winfo_width()/2,
-                    335 + idx * 15,
-                    fill="darkblue",
-                    font="Verdana 9",
-                    text=line
-                )
             '''
             prev button
             
             '''
             self.button_prev = self.canvas.create_oval(
-                (self.root.winfo_width()-50)/2 - 150,
+                PREV_X,
                 350,
                 50 +
-                (self.root.winfo_width(
-                )-50)/2 - 150,
+                PREV_X,
                 400,
                 fill='',
                 width=2,
@@ -795,14 +743,14 @@ class App():
                 fill='green'
             )
             self.tk_button_prev_bg = ImageTk.PhotoImage(self.button_prev_bg)
-            self.button_next_bg_img = self.canvas.create_image(
-                (self.root.winfo_width()-50)/2 - 150 + 1,
+            self.button_prev_bg_img = self.canvas.create_image(
+                PREV_X + 1,
                 351,
                 image=self.tk_button_prev_bg,
                 anchor='nw'
             )
             self.prev_button_text = self.canvas.create_text(
-                (self.root.winfo_width()-50)/2 - 150 + 25,
+                PREV_X + 25,
                 375,
                 fill="white",
                 font="Verdana 20",
@@ -814,11 +762,10 @@ class App():
             
             '''
             self.button_next = self.canvas.create_oval(
-                (self.root.winfo_width()-50)/2 + 150,
+                NEXT_X,
                 350,
                 50 +
-                (self.root.winfo_width(
-                )-50)/2 + 150,
+                NEXT_X,
                 400,
                 fill='',
                 width=2,
@@ -832,212 +779,309 @@ class App():
             )
             self.tk_button_next_bg = ImageTk.PhotoImage(self.button_next_bg)
             self.button_next_bg_img = self.canvas.create_image(
-                (self.root.winfo_width()-50)/2 + 150 + 1,
+                NEXT_X + 1,
                 351,
                 image=self.tk_button_next_bg,
                 anchor='nw'
             )
             self.next_button_text = self.canvas.create_text(
-                (self.root.winfo_width()-50)/2 + 150 + 25,
+                NEXT_X + 25,
                 375,
                 fill="white",
                 font="Verdana 20",
                 text=">>"
             )
 
+            # hover and idle states are pasted into the images shown above
+            self.button_images = (
+                self.tk_button_quit_bg,
+                self.tk_button_prev_bg,
+                self.tk_button_next_bg
+            )
+            self.button_fills = [None] * len(BUTTONS)
+
             self.canvas.bind("<Button-1>", onclick)
             self.canvas.bind("<Motion>", moved)
             self.canvas.bind("<FocusOut>", self.reset)
 
             self.canvas.pack()
 
-            self.menu = tk.Menu(self.root, tearoff=0)
-            self.menu.add_command(label="Quit", command=self.quit)
-            self.menu.add_command(label="ToogleOnTop", command=self.switch)
-            if len(self.image_keys) > 1:
-                self.image_selection_menu = tk.Menu(self.root, tearoff=0)
-                for image_key in self.image_keys:
-                    self.image_selection_menu.add_command(
-                        label=image_key,
-                        command=(
-                            lambda *args, image_key=image_key, self=self: (
-                                setattr(
-                                    self,
-                                    'image_selector',
-                                    self.image_keys.index(image_key)
-                                ),
-                                self.__paint()
-                            )
-                        )
+            self.__draw_kanji()
+            self.root.update_idletasks()
+            self.__start_timers()
+
+    def __draw_button(self, n, fill):
+        if fill == self.button_fills[n]:
+            return
+        # the canvas item keeps its image, only the pixels are replaced
+        self.button_images[n].paste(App.draw_ellipse_with_gradient(
+            border_width=2,
+            size=(50, 50),
+            thick=BUTTONS[n][1],
+            fill=fill
+        ))
+        self.button_fills[n] = fill
+
+    def __start_timers(self):
+        self._update_after = self.__schedule(self._update_after, 100, self.__update)
+        self._bw_after = self.__schedule(self._bw_after, 100, self.__monitor_bandwidth)
+
+    def __schedule(self, after_id, ms, func):
+        # every loop keeps at most one pending callback, returns the new id
+        self.__cancel(after_id)
+        return self.root.after(ms, func)
+
+    def __cancel(self, after_id):
+        # returns None so that callers can clear their id in the same line
+        if after_id is not None:
+            self.root.after_cancel(after_id)
+        return None
+
+    def __get_frame(self, choice, image_selector):
+        key = (choice, image_selector)
+        if key in self.frame_cache:
+            self.frame_cache.move_to_end(key)
+            return self.frame_cache[key]
+
+        row = self.data[choice]
+        if 'wrapped' not in row:
+            # the text does not depend on the image, wrap it once per kanji
+            row['wrapped'] = wrap_fields(row)
+        image_keys = [
+            'img_{}'.format(i)
+            for i in range(9, -1, -1)
+            if row['img_{}'.format(i)]
+        ]
+        image_data = self.rasterize(choice, image_keys[image_selector])
+        frame = {
+            'image_keys': image_keys,
+            'image': None,
+            **row['wrapped']
+        }
+        if image_data is None:
+            # still rendering, shown without the image and not cached
+            return frame
+        frame['image'] = ImageTk.PhotoImage(Image.open(io.BytesIO(image_data)))
+        self.frame_cache[key] = frame
+        if len(self.frame_cache) > FRAME_CACHE_SIZE:
+            self.frame_cache.popitem(last=False)
+        return frame
+
+    def rasterize(self, choice, image_key):
+        ucs = self.data[choice]['cp_type_ucs']
+        key = (ucs, image_key)
+        if key in self.png_cache:
+            self.png_cache.move_to_end(key)
+            return self.png_cache[key]
+        row = self.conn.execute(
+            'SELECT png FROM raster WHERE cp_type_ucs = ? AND img = ?;',
+            key
+        ).fetchone()
+        if row:
+            self.__cache_png(key, row['png'])
+            return row['png']
+        # returns None until the worker is done, __poll_raster() redraws
+        if key not in self.raster_jobs:
+            self.raster_jobs[key] = self.raster_pool.submit(
+                svg_to_png, self.data[choice][image_key]
+            )
+        if self._raster_after is None:
+            self._raster_after = self.root.after(50, self.__poll_raster)
+        return None
+
+    def __cache_png(self, key, png):
+        # PNG bytes are small, the frame cache holds the decoded images
+        self.png_cache[key] = png
+        if len(self.png_cache) > PNG_CACHE_SIZE:
+            self.png_cache.popitem(last=False)
+
+    def __poll_raster(self):
+        self._raster_after = None
+        redraw = False
+        for key, job in list(self.raster_jobs.items()):
+            if job.done():
+                del self.raster_jobs[key]
+                # the connection belongs to the Tk thread, so store it here
+                self.conn.execute(
+                    'REPLACE INTO raster(cp_type_ucs, img, png) VALUES(?, ?, ?);',
+                    (*key, job.result())
+                )
+                self.__cache_png(key, job.result())
+                redraw |= key[0] == self.data[self.choice]['cp_type_ucs']
+        if redraw and hasattr(self, '_App__refresh_kanji'):
+            self.__refresh_kanji()
+        if self.raster_jobs:
+            self._raster_after = self.root.after(50, self.__poll_raster)
+
+    def __draw_kanji(self):
+        if self.canvas.winfo_exists():
+            frame = self.__get_frame(self.choice, self.image_selector)
+            self.image_keys = frame['image_keys']
+            # the PhotoImage has to stay referenced while it is displayed
+            self.tk_image = frame['image']
+            if self.tk_image is not None:
+                self.canvas.create_image(
+                    (WIDTH-150)/2,
+                    70,
+                    anchor=tk.NW,
+                    image=self.tk_image,
+                    tags='kanji'
+                )
+            for lines, y, step, fill, font in (
+                (frame['on'], 210, 20, "maroon", "Verdana 14 bold"),
+                (frame['kun'], 230, 20, "darkblue", "Verdana 14 bold"),
+                (frame['nanori'], 270, 20, "darkgreen", "Verdana 14 bold"),
+                (frame['radicals'], 320, 15, "darkblue", "Verdana 10 bold"),
+                (frame['meanings'], 335, 15, "darkblue", "Verdana 9")
+            ):
+                if lines:
+                    # one multi-line item per block, centered where the
+                    # middle of the separately drawn lines used to be
+                    self.canvas.create_text(
+                        WIDTH/2,
+                        y + (len(lines) - 1) * step / 2,
+                        fill=fill,
+                        font=font,
+                        justify=tk.CENTER,
+                        text='\n'.join(lines),
+                        tags='kanji'
                     )
-                self.menu.add_cascade(
-                    label="Images",
-                    menu=self.image_selection_menu
+            if frame['jlpt']:
+                self.canvas.create_text(
+                    WIDTH/2 - 110,
+                    170,
+                    fill="darkgreen",
+                    font="Verdana 10",
+                    text='JLPT: ' + frame['jlpt'],
+                    tags='kanji'
                 )
-            self.__refresh_search_menu()
-            self.menu.add_command(label="Cancel", command=self.menu.unpost)
-            self.menu.insert_separator(
-                2 + int(bool(self.search_phrase)) +
-                int(len(self.image_keys) > 1)
+            if frame['grade']:
+                self.canvas.create_text(
+                    WIDTH/2 - 120,
+                    190,
+                    fill="darkgreen",
+                    font="Verdana 10",
+                    text='grade: ' + frame['grade'],
+                    tags='kanji'
+                )
+            self.canvas.create_text(
+                WIDTH/2 + 120,
+                190,
+                fill="red",
+                font="Verdana 10",
+                text=frame['stroke_count'] + ' strokes',
+                tags='kanji'
             )
-            self.root.update()
-            for attr, func in zip(
-                ('after_id', 'after_id_4'),
-                (self.__update, self.__monitor_bandwidth)
-            ):
-                setattr(self, attr, self.root.after(100, func))
+            # keep the kanji below the buttons, like the initial paint did
+            self.canvas.tag_lower('kanji', self.button_prev)
+
+    def __refresh_image_menu(self):
+        # filled on demand, only once the menu is opened for another kanji
+        if self.image_menu_choice == self.choice:
+            return
+        self.image_menu_choice = self.choice
+        App.fill_menu(self.image_selection_menu, [
+            (image_key, (self.select_image_cmd, idx))
+            for idx, image_key in enumerate(self.image_keys)
+        ])
+        self.menu.entryconfigure(
+            "Images",
+            state='normal' if len(self.image_keys) > 1 else 'disabled'
+        )
+
+    def __refresh_kanji(self):
+        # only the kanji specific items are replaced, the rest is static
+        if self.root.winfo_exists() and self.canvas.winfo_exists():
+            self.canvas.delete('kanji')
+            self.__draw_kanji()
+            # users mostly step through with << and >>, warm up both sides
+            self.root.after_idle(self.__prefetch, self.choice + 1)
+            self.root.after_idle(self.__prefetch, self.choice - 1)
+
+    def __prefetch(self, choice):
+        # fills the frame cache without touching the canvas
+        if self.root.winfo_exists():
+            self.__get_frame(choice % len(self.data), 0)
 
     def next(self, *args):
         if self.root.winfo_exists():
-            if hasattr(self, "after_id"):
-                self.root.after_cancel(self.after_id)
             if self.choice < len(self.data) - 1:
                 self.choice += 1
             else:
                 self.choice = 0
-            with sqlite3.connect(self.database) as conn:
-                cur = conn.cursor()
-                cur.execute('''REPLACE INTO settings(idx, choice, screen0x, screen0y, screen1x, screen1y) 
-                VALUES(1, {}, {});'''.format(
-                    self.choice,
-                    ', '.join(map(str, self.screen0 + self.screen1))
-                ))
-                conn.commit()
-            if hasattr(self, '_App__paint'):
-                self.__paint()
+            self.save_settings()
+            if hasattr(self, '_App__refresh_kanji'):
+                self.__refresh_kanji()
 
     def prev(self, *args):
         if self.root.winfo_exists():
-            if hasattr(self, "after_id"):
-                self.root.after_cancel(self.after_id)
-                delattr(self, 'after_id')
             if self.choice > 0:
                 self.choice -= 1
             else:
                 self.choice = len(self.data) - 1
-            with sqlite3.connect(self.database) as conn:
-                cur = conn.cursor()
-                cur.execute('''REPLACE INTO settings(idx, choice, screen0x, screen0y, screen1x, screen1y) 
-                VALUES(1, {}, {});'''.format(
-                    self.choice,
-                    ', '.join(map(str, self.screen0 + self.screen1))
-                ))
-                conn.commit()
-            if hasattr(self, '_App__paint'):
-                self.__paint()
+            self.save_settings()
+            if hasattr(self, '_App__refresh_kanji'):
+                self.__refresh_kanji()
 
     def reset(self, *args):
         if self.root.winfo_exists() and hasattr(self, 'canvas') and self.canvas.winfo_exists():
-            if hasattr(self, "after_id_2"):
-                self.root.after_cancel(self.after_id_2)
-                delattr(self, 'after_id_2')
-
-            self.button_quit_bg = App.draw_ellipse_with_gradient(
-                border_width=2,
-                size=(50, 50),
-                thick=5,
-                fill='red'
-            )
-            self.tk_button_quit_bg = ImageTk.PhotoImage(self.button_quit_bg)
-            self.button_quit_bg_img = self.canvas.create_image(
-                (self.root.winfo_width()-50)/2+1,
-                6,
-                image=self.tk_button_quit_bg,
-                anchor='nw'
-            )
-            self.button_quit_text = self.canvas.create_text(
-                self.root.winfo_width()/2,
-                30,
-                fill="white",
-                font="Verdana 20",
-                text="—"
-            )
-            self.button_prev_bg = App.draw_ellipse_with_gradient(
-                border_width=2,
-                size=(50, 50),
-                thick=6,
-                fill='green'
-            )
-            self.tk_button_prev_bg = ImageTk.PhotoImage(self.button_prev_bg)
-            self.button_prev_bg_img = self.canvas.create_image(
-                (self.root.winfo_width()-50)/2 - 150 + 1,
-                351,
-                image=self.tk_button_prev_bg,
-                anchor='nw'
-            )
-            self.prev_button_text = self.canvas.create_text(
-                (self.root.winfo_width()-50)/2 - 150 + 25,
-                375,
-                fill="white",
-                font="Verdana 20",
-                text="<<"
-            )
-            self.button_next_bg = App.draw_ellipse_with_gradient(
-                border_width=2,
-                size=(50, 50),
-                thick=6,
-                fill='green'
-            )
-            self.tk_button_next_bg = ImageTk.PhotoImage(self.button_next_bg)
-            self.button_next_bg_img = self.canvas.create_image(
-                (self.root.winfo_width()-50)/2 + 150 + 1,
-                351,
-                image=self.tk_button_next_bg,
-                anchor='nw'
-            )
-            self.next_button_text = self.canvas.create_text(
-                (self.root.winfo_width()-50)/2 + 150 + 25,
-                375,
-                fill="white",
-                font="Verdana 20",
-                text=">>"
-            )
+            self._fade_after = self.__cancel(self._fade_after)
+            for n, (*_, idle) in enumerate(BUTTONS):
+                self.__draw_button(n, idle)
 
     def awake(self, *args):
         if self.root.winfo_exists():
-            if hasattr(self, "after_id_2"):
-                self.root.after_cancel(self.after_id_2)
-                delattr(self, 'after_id_2')
+            self._fade_after = self.__cancel(self._fade_after)
             self.opacity = .8
+            # Tk repaints the window at the next idle, nothing to flush here
             self.root.attributes('-alpha', self.opacity)
-            self.root.update()
 
     def fadeOut(self):
         if self.onTop and self.root.winfo_exists():
             if hasattr(self, 'opacity'):
                 if self.opacity > 0.1:
-                    self.opacity -= 0.0025
+                    # same 0.25/s fade as before, in 4 times fewer steps
+                    self.opacity = max(self.opacity - 0.01, 0.1)
                 else:
-                    if hasattr(self, "after_id_2"):
-                        self.root.after_cancel(self.after_id_2)
-                        delattr(self, 'after_id_2')
+                    self._fade_after = self.__cancel(self._fade_after)
                     return
             else:
                 self.opacity = .8
             self.root.attributes('-alpha', self.opacity)
-            self.root.update()
             if hasattr(self, 'fadeOut'):
-                self.after_id_2 = self.root.after(10, self.fadeOut)
+                self._fade_after = self.__schedule(self._fade_after, 40, self.fadeOut)
 
     def quit(self):
         if self.root.winfo_exists():
-            for attr in ['after_id', 'after_id_2', 'after_id_3', 'after_id_4']:
-                if hasattr(self, attr):
-                    self.root.after_cancel(getattr(self, attr))
-                    delattr(self, attr)
+            self._update_after = self.__cancel(self._update_after)
+            self._fade_after = self.__cancel(self._fade_after)
+            self._bw_after = self.__cancel(self._bw_after)
+            self._geometry_after = self.__cancel(self._geometry_after)
+            self._raster_after = self.__cancel(self._raster_after)
+            self._clock_after = self.__cancel(self._clock_after)
+            self.raster_pool.shutdown(wait=False)
             if hasattr(self, 'icon'):
                 self.icon.stop()
+            self.stopped.set()
+            self.conn.close()
             self.root.destroy()
 
     def show(self):
         if self.root.winfo_exists():
+            self.visible = True
             self.root.deiconify()
             self.root.lift()
+            # the timers stopped rescheduling themselves while hidden
+            self.__start_timers()
         if hasattr(self, 'icon'):
             self.icon.stop()
 
     def withdraw(self):
         if self.root.winfo_exists():
+            # the tray icon is rarely used, do not load it at startup
+            import pystray
+            from pystray import MenuItem as item
+            self.visible = False
             self.root.withdraw()
             image = Image.open(ICON)
             menu = pystray.Menu(
@@ -1066,125 +1110,169 @@ class App():
         self.onTop = not self.onTop if hasattr(self, 'onTop') else False
         if self.root.winfo_exists() and hasattr(self, '_App__paint'):
             self.root.call('wm', 'attributes', '.', '-topmost', self.onTop)
-            self.root.update()
+
+    def select_image(self, idx):
+        self.image_selector = int(idx)
+        if hasattr(self, '_App__refresh_kanji'):
+            self.__refresh_kanji()
 
     def search(self, ch):
-        key = '/'.join(
-            map(
-                lambda x: hex(int(''.join(x), 16)),
-                zip(*[iter(ch.encode('utf-8').hex())]*2)
-            )
-        )
-        self.search_results = [
-            row for row, _ in enumerate(self.data)
-            if self.data[row]['bytes'] == key
-        ]
-        self.choice = next(iter(self.search_results), self.choice)
-        if hasattr(self, '_App__paint'):
-            self.__paint()
+        # same encoding as the "bytes" column written by build_db.py
+        key = '/'.join([HEX_BYTES[b] for b in ch.encode('utf-8')])
+        if self.char_index is None:
+            # built on the first search, first row wins like the scan did
+            self.char_index = {}
+            for row, entry in enumerate(self.data):
+                self.char_index.setdefault(entry['bytes'], row)
+        self.choice = self.char_index.get(key, self.choice)
+        if hasattr(self, '_App__refresh_kanji'):
+            self.__refresh_kanji()
 
     def __refresh_search_menu(self):
         exception_msg = "Failed to open clipboard"
+        now = time.monotonic()
+        if now - self.clipboard_ts < 1.0:
+            # the clipboard has been read just a moment ago
+            return
+        self.clipboard_ts = now
         try:
-            self.search_phrase = ''.join(
-                re.findall(
-                    u'[\u4E00-\u9FFF]',  # kanji only
-                    pyperclip.paste(),
-                    re.U
-                )
-            )
+            clip = pyperclip.paste()
+            if clip == self.last_clip:
+                # nothing changed since the menu has been built last time
+                return
+            self.last_clip = clip
+            self.search_phrase = ''.join(KANJI_RE.findall(clip))
         except:
+            self.last_clip = None
             self.search_phrase = exception_msg
-        if self.search_phrase and self.menu.winfo_exists():
-            try:
-                self.menu.delete("Search")
-            except:
-                ...
-            self.clipboard_menu = tk.Menu(self.root, tearoff=0)
+        if self.menu.winfo_exists():
             if self.search_phrase != exception_msg:
-                for idx, ch in enumerate(self.search_phrase[:10]):
-                    self.clipboard_menu.insert_command(
-                        idx,
-                        label=f"{idx: 2d}: {ch}",
-                        command=lambda ch=ch, self=self: self.search(ch)
-                    )
+                App.fill_menu(self.clipboard_menu, [
+                    (f"{idx: 2d}: {ch}", (self.search_cmd, ch))
+                    for idx, ch in enumerate(self.search_phrase[:10])
+                ])
             else:
-                self.clipboard_menu.insert_command(
-                    0,
-                    label=exception_msg,
-                    command=lambda *args: None
-                )
-            self.menu.insert_cascade(
-                1 + int(bool(self.search_phrase)) +
-                int(len(self.image_keys) > 1),
-                label="Search",
-                menu=self.clipboard_menu
+                App.fill_menu(self.clipboard_menu, [(exception_msg, '')])
+            self.menu.entryconfigure(
+                "Search",
+                state='normal' if self.search_phrase else 'disabled'
             )
 
     @staticmethod
+    def fill_menu(menu, entries):
+        # reuse the existing entries, only the surplus is added or removed
+        last = menu.index('end')
+        count = 0 if last is None else last + 1
+        for idx, (label, command) in enumerate(entries):
+            if idx < count:
+                menu.entryconfigure(idx, label=label, command=command)
+            else:
+                menu.add_command(label=label, command=command)
+        if len(entries) < count:
+            # Menu.delete would unregister the shared Tcl commands otherwise
+            for idx in range(len(entries), count):
+                menu.entryconfigure(idx, command='')
+            menu.delete(len(entries), 'end')
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
     def draw_ellipse_with_gradient(border_width, size, thick, fill):
-        mask = Image.new(
-            "RGBA",
-            (size[0]-border_width, size[1]-border_width),
-            (0, 0, 0, 255)
-        )
-        draw = ImageDraw.Draw(mask)
-        draw.ellipse((thick, thick, size[0]-thick, size[1]-thick), fill=fill)
-        img = mask.filter(ImageFilter.GaussianBlur(thick//2))
-        mask2 = Image.new('L', (size[0]-border_width, size[1]-border_width), 0)
-        draw2 = ImageDraw.Draw(mask2)
-        draw2.ellipse(
-            (
-                0, 0,
-                size[0]-border_width,
-                size[1]-border_width
-            ),
-            fill=255
+        # only a handful of (size, color) combinations is ever drawn,
+        # so every gradient is rendered once and reused afterwards
+        inner = (size[0]-border_width, size[1]-border_width)
+        # the color fades into black along the blurred edge of the disc
+        img = Image.composite(
+            Image.new('RGB', inner, fill),
+            Image.new('RGB', inner, (0, 0, 0)),
+            shading_mask(size, border_width, thick)
         )
-        img.putalpha(mask2)
+        img.putalpha(ellipse_mask(inner))
         return img
 
     def __update(self):
+        if not self.visible:
+            # nothing to paint in the tray, show() starts the clock again
+            self._update_after = None
+            return
         tt = time.time()
+        # a tenth of a second is the finest step the hands are drawn at
+        tick = int(tt * 10)
+        if tick == self.last_tick:
+            self._update_after = self.__schedule(self._update_after, 5, self.__update)
+            return
+        self.last_tick = tick
         now_loc = time.localtime(tt)
-        mlsec = float("%.9f" % (tt % 1,))
-        t = time.strptime(str(now_loc.tm_hour), "%H")
-        hour = int(time.strftime("%I", t))*30
+        mlsec = tt - int(tt)
+        # 12-hour dial, midnight and noon point up like 12 o'clock
+        hour = (now_loc.tm_hour % 12 or 12)*30
         now = (hour + 30*now_loc.tm_min/60, now_loc.tm_min*6 +
                6*now_loc.tm_sec/60, now_loc.tm_sec*6 + 6*mlsec)
-        # Changing Stick Coordinates
-        for n, i in enumerate(now):
-            x, y = self.canvas.coords(self.sticks[n])[0:2]
-            cr = [x, y]
-            cr.append(
-                self.length[n] * math.cos(math.radians(i) -
-                                          math.radians(90)) + self.root.winfo_width()/2
-            )
-            cr.append(
-                self.length[n] *
-                math.sin(math.radians(i) - math.radians(90)) + 60 + 175
-            )
-            if hasattr(self, 'canvas') and self.canvas.winfo_exists() and hasattr(self.canvas, 'coords'):
-                self.canvas.coords(self.sticks[n], tuple(cr))
-                self.canvas.coords(self.antialiasing[n], tuple(cr))
-        if hasattr(self, 'canvas') and self.canvas.winfo_exists():
-            self.canvas.itemconfig(self.timer, extent=-now[1])
+        # the canvas is changed in one go once Tk is idle
+        self.pending_clock = now
+        if self._clock_after is None:
+            self._clock_after = self.root.after_idle(self.__apply_clock)
         if now_loc.tm_sec == 59 and int(mlsec * 10) == 0 and now_loc.tm_min == 59:
             self.next()
         if self.root.winfo_exists() and hasattr(self, '_App__update'):
-            if hasattr(self, 'after_id'):
-                self.root.after_cancel(self.after_id)
-                delattr(self, 'after_id')
-            self.after_id = self.root.after(5, self.__update)
+            # wake up right after the next tenth of a second starts
+            self._update_after = self.__schedule(
+                self._update_after,
+                100 - int(mlsec * 1000) % 100,
+                self.__update
+            )
+
+    def __apply_clock(self):
+        self._clock_after = None
+        now = self.pending_clock
+        # the canvas lives for the whole tick, ask Tk only once
+        if not (hasattr(self, 'canvas') and self.canvas.winfo_exists()):
+            return
+        # Changing Stick Coordinates
+        self.__move_sticks(now)
+        if -now[1] != self.last_extent:
+            self.canvas.itemconfig(self.timer, extent=-now[1])
+            self.last_extent = -now[1]
+
+    def __move_sticks(self, now):
+        # the pivot is fixed, only the tip of each stick has to be computed
+        cx, cy = CLOCK_CENTER
+        # bound once, the loop below runs on every tick
+        vectors, coords, last_coords = UNIT_VECTORS, self.canvas.coords, self.last_coords
+        for n, ((stick, shadow, length), angle) in enumerate(zip(self.hands, now)):
+            # hour and minute hands move in multiples of a tenth of a degree
+            cos, sin = vectors[round(angle * 10) % 3600]
+            cr = (
+                cx, cy,
+                cx + length * cos,
+                cy + length * sin
+            )
+            # the hour hand moves once a minute, the minute hand once a second
+            if cr != last_coords[n]:
+                coords(stick, cr)
+                coords(shadow, cr)
+                last_coords[n] = cr
+
+    def sample_bandwidth(self):
+        while not self.stopped.wait(1):
+            if self.visible:
+                self.bandwidth_queue.put(self.send_stat())
 
     def __monitor_bandwidth(self):
+        if not self.visible:
+            self._bw_after = None
+            return
         if self.canvas.winfo_exists():
-            self.canvas.itemconfig(self.bandwidth, text=self.send_stat())
+            text = self.bandwidth_text
+            try:
+                while True:
+                    text = self.bandwidth_queue.get_nowait()
+            except queue.Empty:
+                pass
+            if text != self.bandwidth_text:
+                self.canvas.itemconfig(self.bandwidth, text=text)
+                self.bandwidth_text = text
         if self.root.winfo_exists() and hasattr(self, '_App__monitor_bandwidth'):
-            if hasattr(self, 'after_id_4'):
-                self.root.after_cancel(self.after_id_4)
-                delattr(self, 'after_id_4')
-            self.after_id_4 = self.root.after(1000, self.__monitor_bandwidth)
+            self._bw_after = self.__schedule(self._bw_after, 100, self.__monitor_bandwidth)
 
 
 if __name__ == '__main__':